@@ -0,0 +1,47 @@
+"""One-off migration: build alert summaries for alerts that predate them.
+
+Run once after upgrading, before starting the new server version:
+
+    cd backend
+    python migrate_alert_summaries.py
+
+The migration is recorded in the `migrations` collection and is skipped on
+later runs. Use --force to rebuild every summary from the alerts collection
+again (for example to reconcile counts after a crash); do it while no server
+is accepting alerts.
+"""
+import asyncio
+import sys
+from datetime import datetime, timezone
+
+from server import PRIORITY_READ, clients, databases, recompute_alert_summaries
+
+MIGRATION_ID = "alert_summaries_v1"
+
+async def main(force: bool = False) -> int:
+    db = databases[PRIORITY_READ]
+    marker = await db.migrations.find_one({"_id": MIGRATION_ID})
+    if marker and marker.get('completed_at') and not force:
+        print(f"Migração {MIGRATION_ID} já aplicada em {marker['completed_at']}")
+        return 0
+    
+    await db.migrations.update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"started_at": datetime.now(timezone.utc).isoformat()}, "$unset": {"completed_at": ""}},
+        upsert=True
+    )
+    await db.alert_summaries.create_index("user_id", unique=True)
+    await recompute_alert_summaries(db)
+    await db.migrations.update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"completed_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    print(f"Migração {MIGRATION_ID} concluída")
+    return 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(asyncio.run(main(force="--force" in sys.argv)))
+    finally:
+        for priority_client in clients.values():
+            priority_client.close()
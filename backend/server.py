@@ -1,38 +1,81 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
+import json
 import logging
+import socket
+from abc import ABC, abstractmethod
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, PlainSerializer
+from typing import Annotated, Awaitable, Callable, Dict, List, Optional, Set
 import uuid
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+import httpx
+import redis.asyncio as redis
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# Request priorities
+PRIORITY_EMERGENCY = "emergency"
+PRIORITY_AUTH = "auth"
+PRIORITY_READ = "read"
+
+# Per-worker concurrency limits and queue timeouts (seconds) for each priority
+PRIORITY_LIMITS = {
+    PRIORITY_EMERGENCY: int(os.environ.get('EMERGENCY_CONCURRENCY', '64')),
+    PRIORITY_AUTH: int(os.environ.get('AUTH_CONCURRENCY', '8')),
+    PRIORITY_READ: int(os.environ.get('READ_CONCURRENCY', '4')),
+}
+PRIORITY_QUEUE_TIMEOUTS = {
+    PRIORITY_EMERGENCY: None,  # SOS requests are never shed
+    PRIORITY_AUTH: float(os.environ.get('AUTH_QUEUE_TIMEOUT', '10')),
+    PRIORITY_READ: float(os.environ.get('READ_QUEUE_TIMEOUT', '5')),
+}
+
+# MongoDB connection, one pool partition per priority so reads cannot
+# exhaust the connections needed by emergency requests
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+PRIORITY_POOL_SIZES = {
+    PRIORITY_EMERGENCY: int(os.environ.get('EMERGENCY_POOL_SIZE', '20')),
+    PRIORITY_AUTH: int(os.environ.get('AUTH_POOL_SIZE', '10')),
+    PRIORITY_READ: int(os.environ.get('READ_POOL_SIZE', '20')),
+}
+clients = {
+    priority: AsyncIOMotorClient(mongo_url, maxPoolSize=pool_size)
+    for priority, pool_size in PRIORITY_POOL_SIZES.items()
+}
+databases = {priority: priority_client[os.environ['DB_NAME']] for priority, priority_client in clients.items()}
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 SECRET_KEY = os.environ.get('SECRET_KEY', 'safehaven-secret-key-change-in-production')
 ALGORITHM = "HS256"
+STREAM_TOKEN_SCOPE = "stream"
+STREAM_TOKEN_TTL = timedelta(seconds=int(os.environ.get('STREAM_TOKEN_TTL', '60')))
 
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
+# Timestamps are stored and returned as isoformat strings ("+00:00"), so the
+# models serialize them the same way as the raw documents served below
+def isoformat_utc(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat()
+
+Timestamp = Annotated[datetime, PlainSerializer(isoformat_utc, when_used="json")]
+
 # Models
 class UserRegister(BaseModel):
     email: EmailStr
@@ -54,7 +97,7 @@ class User(BaseModel):
     email: str
     name: str
     phone: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: Timestamp = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class TrustedContact(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -63,7 +106,7 @@ class TrustedContact(BaseModel):
     name: str
     email: EmailStr
     phone: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: Timestamp = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class TrustedContactCreate(BaseModel):
     name: str
@@ -75,18 +118,112 @@ class Alert(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: Timestamp = Field(default_factory=lambda: datetime.now(timezone.utc))
     location: Optional[str] = None
     sent_to: List[str] = []
+    deliveries: Dict[str, Dict[str, str]] = {}
+    broadcasts: Dict[str, str] = {}
 
 class AlertCreate(BaseModel):
     location: Optional[str] = None
 
+class AlertSummary(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    user_id: str
+    total_alerts: int = 0
+    unacknowledged_alerts: int = 0
+    last_alert_at: Optional[Timestamp] = None
+    version: int = 0
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
     user: User
 
+class StreamTokenResponse(BaseModel):
+    token: str
+    expires_in: int
+
+# Projections for hot read paths. The contact and alert list routes return
+# the stored documents as-is (timestamps are already ISO strings), so the
+# models above only validate input and document those responses.
+USER_PROJECTION = {"_id": 0, "id": 1, "email": 1, "name": 1, "phone": 1, "created_at": 1}
+CONTACT_PROJECTION = {"_id": 0, "id": 1, "user_id": 1, "name": 1, "email": 1, "phone": 1, "created_at": 1}
+
+def encode_timestamp(doc: dict, field: str) -> dict:
+    """Guard raw passthrough against documents holding a BSON datetime instead of a string"""
+    if isinstance(doc.get(field), datetime):
+        doc[field] = isoformat_utc(doc[field])
+    return doc
+
+# Admission scheduling
+class AdmissionScheduler:
+    """Per-worker admission control with a separate concurrency limit per priority.
+
+    While any emergency request is in flight, no new lower-priority request is
+    admitted, so SOS requests only share the event loop with work already running.
+    """
+
+    def __init__(self, limits: Dict[str, int], queue_timeouts: Dict[str, Optional[float]]):
+        self.semaphores = {priority: asyncio.Semaphore(limit) for priority, limit in limits.items()}
+        self.queue_timeouts = queue_timeouts
+        self.emergencies = 0
+        self.no_emergency = asyncio.Event()
+        self.no_emergency.set()
+
+    async def admit(self, priority: str):
+        if priority != PRIORITY_EMERGENCY:
+            await self.no_emergency.wait()
+        await self.semaphores[priority].acquire()
+
+    async def acquire(self, priority: str) -> bool:
+        if priority == PRIORITY_EMERGENCY:
+            self.emergencies += 1
+            self.no_emergency.clear()
+        timeout = self.queue_timeouts.get(priority)
+        if timeout is None:
+            await self.admit(priority)
+            return True
+        try:
+            await asyncio.wait_for(self.admit(priority), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def release(self, priority: str):
+        self.semaphores[priority].release()
+        if priority == PRIORITY_EMERGENCY:
+            self.emergencies -= 1
+            if not self.emergencies:
+                self.no_emergency.set()
+
+scheduler = AdmissionScheduler(PRIORITY_LIMITS, PRIORITY_QUEUE_TIMEOUTS)
+
+def scheduled(priority: str):
+    """Route dependency that admits the request under a priority and yields that priority's database.
+
+    Declaring it on the route is the only place a request's priority is set.
+    """
+    async def admit(request: Request):
+        if not await scheduler.acquire(priority):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servidor ocupado, tente novamente",
+                headers={"Retry-After": "1"},
+            )
+        request.state.priority = priority
+        try:
+            yield databases[priority]
+        finally:
+            scheduler.release(priority)
+    return admit
+
+# Emergency: SOS and acknowledgements. Auth: logins plus account writes
+# (bcrypt hashing and deletions). Read: everything that polls.
+EmergencyDB = Depends(scheduled(PRIORITY_EMERGENCY))
+AuthDB = Depends(scheduled(PRIORITY_AUTH))
+ReadDB = Depends(scheduled(PRIORITY_READ))
+
 # Helper functions
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -100,36 +237,40 @@ def create_access_token(data: dict, expires_delta: timedelta = timedelta(days=7)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+def decode_token(token: str, scope: Optional[str] = None) -> str:
+    """Return the subject of a token issued for the given scope (None for session tokens)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Token inválido",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
-        if user_id is None:
+        if user_id is None or payload.get("scope") != scope:
             raise credentials_exception
         return user_id
     except JWTError:
         raise credentials_exception
 
-def send_alert_email(recipient_email: str, recipient_name: str, user_name: str, location: str = None):
-    """Send emergency alert email"""
-    sendgrid_key = os.environ.get('SENDGRID_API_KEY')
-    sender_email = os.environ.get('SENDER_EMAIL', 'noreply@safehaven.com')
-    
-    if not sendgrid_key:
-        logging.warning("SendGrid API key not configured")
-        return False
-    
-    subject = "🚨 ALERTA DE EMERGÊNCIA - SafeHaven"
-    
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    return decode_token(credentials.credentials)
+
+async def get_stream_user(token: str) -> str:
+    # EventSource cannot send headers, so the stream takes a short-lived
+    # stream token in the query string instead of the session token
+    return decode_token(token, scope=STREAM_TOKEN_SCOPE)
+
+async def resolve_alert_owner(db, user_id: str) -> str:
+    """Contacts see the alerts of the user who added them"""
+    contact = await db.trusted_contacts.find_one({"id": user_id}, {"_id": 0, "user_id": 1})
+    return contact['user_id'] if contact else user_id
+
+def build_alert_html(recipient_name: str, user_name: str, location: str = None) -> str:
+    """Build the HTML body of an emergency alert email"""
     location_text = f"<p><strong>Localização:</strong> {location}</p>" if location else ""
     
-    html_content = f"""
+    return f"""
     <html>
         <body style="font-family: Arial, sans-serif; padding: 20px; background-color: #fff5f5;">
             <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px; border-left: 5px solid #dc2626;">
@@ -153,31 +294,460 @@ def send_alert_email(recipient_email: str, recipient_name: str, user_name: str,
         </body>
     </html>
     """
+
+def build_alert_text(user_name: str, location: str = None) -> str:
+    """Build the short plain-text alert used by SMS and push"""
+    text = f"🚨 ALERTA SafeHaven: {user_name} enviou um alerta de emergência. Entre em contato imediatamente!"
+    if location:
+        text += f" Localização: {location}"
+    return text
+
+# Notification backends
+class Notifier(ABC):
+    """Base class for an alert delivery channel with its own HTTP pool, timeout and concurrency limit"""
+    channel = ""
+
+    def __init__(self, base_url: str, timeout: float = 10.0, pool_size: int = 10, concurrency: int = 10):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    @classmethod
+    @abstractmethod
+    def from_env(cls) -> Optional["Notifier"]:
+        """Build the notifier from environment settings, or None when the channel is not configured"""
+
+    @staticmethod
+    def limits_from_env(prefix: str) -> dict:
+        return {
+            "timeout": float(os.environ.get(f'{prefix}_TIMEOUT', '10')),
+            "pool_size": int(os.environ.get(f'{prefix}_POOL_SIZE', '10')),
+            "concurrency": int(os.environ.get(f'{prefix}_CONCURRENCY', '10')),
+        }
+
+    async def guarded(self, delivery: Awaitable[bool], recipient: str) -> bool:
+        # Waiting for a free slot is bounded by the channel timeout too
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            delivery.close()
+            logging.error(f"Failed to send {self.channel} alert to {recipient}: no free slot within {self.timeout}s")
+            return False
+        try:
+            return await delivery
+        except Exception as e:
+            logging.error(f"Failed to send {self.channel} alert to {recipient}: {type(e).__name__} {str(e)}")
+            return False
+        finally:
+            self.semaphore.release()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class ContactNotifier(Notifier):
+    """Channel that delivers the alert to each trusted contact separately"""
+
+    def can_notify(self, contact: dict) -> bool:
+        return True
+
+    @abstractmethod
+    async def deliver(self, contact: dict, user_doc: dict, location: Optional[str]) -> bool:
+        """Deliver the alert to one contact, returning whether it was accepted"""
+
+    async def send(self, contact: dict, user_doc: dict, location: Optional[str]) -> bool:
+        return await self.guarded(self.deliver(contact, user_doc, location), contact['email'])
+
+class BroadcastNotifier(Notifier):
+    """Channel that receives a single delivery per alert covering all contacts"""
+
+    @abstractmethod
+    async def deliver(self, contacts: List[dict], user_doc: dict, location: Optional[str]) -> bool:
+        """Deliver the alert once, returning whether it was accepted"""
+
+    async def send(self, contacts: List[dict], user_doc: dict, location: Optional[str]) -> bool:
+        return await self.guarded(self.deliver(contacts, user_doc, location), self.base_url)
+
+class EmailNotifier(ContactNotifier):
+    """Email delivery through the SendGrid v3 HTTP API"""
+    channel = "email"
+
+    def __init__(self, api_key: str, sender_email: str, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+        self.sender_email = sender_email
+
+    @classmethod
+    def from_env(cls):
+        api_key = os.environ.get('SENDGRID_API_KEY')
+        if not api_key:
+            logging.warning("SendGrid API key not configured")
+            return None
+        return cls(
+            api_key=api_key,
+            sender_email=os.environ.get('SENDER_EMAIL', 'noreply@safehaven.com'),
+            base_url=os.environ.get('SENDGRID_API_URL', 'https://api.sendgrid.com'),
+            **cls.limits_from_env('EMAIL'),
+        )
+
+    async def deliver(self, contact, user_doc, location):
+        response = await self.client.post(
+            f"{self.base_url}/v3/mail/send",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json={
+                "personalizations": [{"to": [{"email": contact['email']}]}],
+                "from": {"email": self.sender_email},
+                "subject": "🚨 ALERTA DE EMERGÊNCIA - SafeHaven",
+                "content": [{
+                    "type": "text/html",
+                    "value": build_alert_html(contact['name'], user_doc['name'], location),
+                }],
+            },
+        )
+        return response.status_code == 202
+
+class SmsNotifier(ContactNotifier):
+    """SMS delivery through a generic HTTP SMS gateway"""
+    channel = "sms"
+
+    def __init__(self, token: Optional[str], sender: Optional[str], **kwargs):
+        super().__init__(**kwargs)
+        self.token = token
+        self.sender = sender
+
+    @classmethod
+    def from_env(cls):
+        base_url = os.environ.get('SMS_GATEWAY_URL')
+        if not base_url:
+            return None
+        return cls(
+            token=os.environ.get('SMS_GATEWAY_TOKEN'),
+            sender=os.environ.get('SMS_SENDER'),
+            base_url=base_url,
+            **cls.limits_from_env('SMS'),
+        )
+
+    def can_notify(self, contact):
+        return bool(contact.get('phone'))
+
+    async def deliver(self, contact, user_doc, location):
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        response = await self.client.post(
+            self.base_url,
+            headers=headers,
+            json={"to": contact['phone'], "from": self.sender, "text": build_alert_text(user_doc['name'], location)},
+        )
+        return response.is_success
+
+class PushNotifier(ContactNotifier):
+    """Web-push delivery through a push relay that holds the contacts' browser subscriptions"""
+    channel = "push"
+
+    def __init__(self, token: Optional[str], **kwargs):
+        super().__init__(**kwargs)
+        self.token = token
+
+    @classmethod
+    def from_env(cls):
+        base_url = os.environ.get('PUSH_GATEWAY_URL')
+        if not base_url:
+            return None
+        return cls(token=os.environ.get('PUSH_GATEWAY_TOKEN'), base_url=base_url, **cls.limits_from_env('PUSH'))
+
+    async def deliver(self, contact, user_doc, location):
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        response = await self.client.post(
+            self.base_url,
+            headers=headers,
+            json={
+                "recipient_id": contact['id'],
+                "title": "🚨 ALERTA DE EMERGÊNCIA",
+                "body": build_alert_text(user_doc['name'], location),
+            },
+        )
+        return response.is_success
+
+class WebhookNotifier(BroadcastNotifier):
+    """Generic JSON webhook, e.g. for a monitoring center"""
+    channel = "webhook"
+
+    def __init__(self, secret: Optional[str], **kwargs):
+        super().__init__(**kwargs)
+        self.secret = secret
+
+    @classmethod
+    def from_env(cls):
+        base_url = os.environ.get('ALERT_WEBHOOK_URL')
+        if not base_url:
+            return None
+        return cls(secret=os.environ.get('ALERT_WEBHOOK_SECRET'), base_url=base_url, **cls.limits_from_env('WEBHOOK'))
+
+    async def deliver(self, contacts, user_doc, location):
+        headers = {"X-SafeHaven-Secret": self.secret} if self.secret else {}
+        response = await self.client.post(
+            self.base_url,
+            headers=headers,
+            json={
+                "contacts": [
+                    {"id": contact['id'], "name": contact['name'], "email": contact['email'], "phone": contact.get('phone')}
+                    for contact in contacts
+                ],
+                "user": {"id": user_doc['id'], "name": user_doc['name'], "phone": user_doc.get('phone')},
+                "location": location,
+            },
+        )
+        return response.is_success
+
+NOTIFIER_CLASSES = [EmailNotifier, SmsNotifier, PushNotifier, WebhookNotifier]
+notifiers: List[Notifier] = [n for n in (cls.from_env() for cls in NOTIFIER_CLASSES) if n]
+
+NOTIFY_DEADLINE = float(os.environ.get('NOTIFY_DEADLINE', '30'))
+delivery_tasks: Set[asyncio.Task] = set()
+
+async def deliver_alert(db, alert_id: str, contacts: List[dict], user_doc: dict, location: Optional[str]):
+    """Fan a stored alert out to every channel of every contact in parallel.
+
+    Each successful delivery is written to the alert as it happens; only the
+    first success per contact and channel is kept.
+    """
+    async def attempt_contact(notifier: ContactNotifier, contact: dict):
+        if not await notifier.send(contact, user_doc, location):
+            return
+        field = f"deliveries.{contact['id']}.{notifier.channel}"
+        await db.alerts.update_one(
+            {"id": alert_id, field: {"$exists": False}},
+            {"$set": {field: datetime.now(timezone.utc).isoformat()}, "$addToSet": {"sent_to": contact['email']}}
+        )
+
+    async def attempt_broadcast(notifier: BroadcastNotifier):
+        if not await notifier.send(contacts, user_doc, location):
+            return
+        await db.alerts.update_one(
+            {"id": alert_id},
+            {"$set": {f"broadcasts.{notifier.channel}": datetime.now(timezone.utc).isoformat()}}
+        )
+
+    attempts = []
+    for notifier in notifiers:
+        if isinstance(notifier, BroadcastNotifier):
+            attempts.append(attempt_broadcast(notifier))
+        else:
+            attempts.extend(attempt_contact(notifier, contact) for contact in contacts if notifier.can_notify(contact))
     
     try:
-        message = Mail(
-            from_email=sender_email,
-            to_emails=recipient_email,
-            subject=subject,
-            html_content=html_content
+        await asyncio.wait_for(asyncio.gather(*attempts, return_exceptions=True), NOTIFY_DEADLINE)
+    except asyncio.TimeoutError:
+        logging.error(f"Delivery of alert {alert_id} did not finish within {NOTIFY_DEADLINE}s")
+
+def start_delivery(*args):
+    """Run deliver_alert in the background so the SOS request never waits on a channel"""
+    task = asyncio.create_task(deliver_alert(*args))
+    delivery_tasks.add(task)
+    task.add_done_callback(delivery_tasks.discard)
+
+# Event bus
+ALERT_CREATED = "alert.created"
+ALERT_ACKNOWLEDGED = "alert.acknowledged"
+NODE_ID = os.environ.get('NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+EVENT_PUBLISH_TIMEOUT = float(os.environ.get('EVENT_PUBLISH_TIMEOUT', '0.5'))
+
+class EventBus(ABC):
+    """Publishes alert events to every node; each node dispatches them to its local subscribers"""
+
+    def __init__(self):
+        self.subscribers: List[Callable[[dict], Awaitable[None]]] = []
+
+    def subscribe(self, handler: Callable[[dict], Awaitable[None]]):
+        self.subscribers.append(handler)
+
+    def unsubscribe(self, handler: Callable[[dict], Awaitable[None]]):
+        if handler in self.subscribers:
+            self.subscribers.remove(handler)
+
+    async def dispatch(self, event: dict):
+        for handler in list(self.subscribers):
+            try:
+                await handler(event)
+            except Exception as e:
+                logging.error(f"Event subscriber failed for {event.get('type')}: {str(e)}")
+
+    @abstractmethod
+    async def publish(self, event: dict):
+        """Send an event to the subscribers of every node"""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+class InMemoryEventBus(EventBus):
+    """Single-node bus, events never leave the process"""
+
+    async def publish(self, event):
+        await self.dispatch(event)
+
+class ListeningEventBus(EventBus):
+    """Bus with a background listener task that reconnects on errors"""
+    reconnect_delay = 1.0
+
+    def __init__(self):
+        super().__init__()
+        self.listener: Optional[asyncio.Task] = None
+
+    @abstractmethod
+    async def listen(self):
+        """Dispatch incoming events until the connection fails"""
+
+    async def run_listener(self):
+        while True:
+            try:
+                await self.listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Event bus listener failed, reconnecting: {str(e)}")
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def start(self):
+        self.listener = asyncio.create_task(self.run_listener())
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+            try:
+                await self.listener
+            except asyncio.CancelledError:
+                pass
+
+class MongoEventBus(ListeningEventBus):
+    """Cross-node bus on a MongoDB change stream (requires a replica set)"""
+
+    def __init__(self, collection, ttl_seconds: int = 3600):
+        super().__init__()
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+
+    async def start(self):
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+        await super().start()
+
+    async def publish(self, event):
+        await self.collection.insert_one({"event": event, "created_at": datetime.now(timezone.utc)})
+
+    async def listen(self):
+        async with self.collection.watch([{"$match": {"operationType": "insert"}}]) as stream:
+            async for change in stream:
+                await self.dispatch(change['fullDocument']['event'])
+
+class RedisEventBus(ListeningEventBus):
+    """Cross-node bus on Redis pub/sub (works with any Redis-compatible server)"""
+
+    def __init__(self, url: str, channel: str = "safehaven:alerts"):
+        super().__init__()
+        self.redis = redis.from_url(url, socket_connect_timeout=EVENT_PUBLISH_TIMEOUT)
+        self.channel = channel
+
+    async def publish(self, event):
+        await self.redis.publish(self.channel, json.dumps(event))
+
+    async def listen(self):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        try:
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    await self.dispatch(json.loads(message['data']))
+        finally:
+            await pubsub.aclose()
+
+    async def stop(self):
+        await super().stop()
+        await self.redis.aclose()
+
+def build_event_bus() -> EventBus:
+    backend = os.environ.get('EVENT_BUS', 'memory')
+    if backend == 'mongo':
+        # Events are published from SOS requests, so use the emergency pool
+        return MongoEventBus(databases[PRIORITY_EMERGENCY].alert_events)
+    if backend == 'redis':
+        return RedisEventBus(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    return InMemoryEventBus()
+
+event_bus = build_event_bus()
+
+async def publish_alert_event(event_type: str, user_id: str, alert_id: str):
+    """Publish an alert event without ever failing or stalling the request that caused it"""
+    event = {
+        "type": event_type,
+        "user_id": user_id,
+        "alert_id": alert_id,
+        "node": NODE_ID,
+        "published_at": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        await asyncio.wait_for(event_bus.publish(event), EVENT_PUBLISH_TIMEOUT)
+    except asyncio.TimeoutError:
+        logging.error(f"Timed out publishing {event_type} for alert {alert_id}")
+    except Exception as e:
+        logging.error(f"Failed to publish {event_type} for alert {alert_id}: {str(e)}")
+
+# Alert summaries
+def alert_summary_pipeline(user_id: Optional[str] = None) -> list:
+    match = [{"$match": {"user_id": user_id}}] if user_id else []
+    return match + [
+        {"$group": {
+            "_id": "$user_id",
+            "total_alerts": {"$sum": 1},
+            "unacknowledged_alerts": {"$sum": {"$cond": [{"$eq": ["$acknowledged", True]}, 0, 1]}},
+            "last_alert_at": {"$max": "$timestamp"}
+        }}
+    ]
+
+async def recompute_alert_summaries(db, user_id: Optional[str] = None):
+    """Rebuild summaries from the alerts collection, for one user or all of them"""
+    async for row in db.alerts.aggregate(alert_summary_pipeline(user_id)):
+        await db.alert_summaries.update_one(
+            {"user_id": row['_id']},
+            {
+                "$set": {
+                    "total_alerts": row['total_alerts'],
+                    "unacknowledged_alerts": row['unacknowledged_alerts'],
+                    "last_alert_at": row['last_alert_at']
+                },
+                "$inc": {"version": 1}
+            },
+            upsert=True
         )
-        sg = SendGridAPIClient(sendgrid_key)
-        response = sg.send(message)
-        return response.status_code == 202
+
+async def update_alert_summary(db, user_id: str, update: dict, upsert: bool = False):
+    """Apply an incremental summary update after the alert write it reflects.
+
+    The alert is always written first, so if this update fails the summary
+    can be rebuilt from the alerts collection.
+    """
+    try:
+        await db.alert_summaries.update_one({"user_id": user_id}, update, upsert=upsert)
     except Exception as e:
-        logging.error(f"Failed to send email to {recipient_email}: {str(e)}")
-        return False
+        logging.error(f"Failed to update alert summary for {user_id}, recomputing: {str(e)}")
+        try:
+            await recompute_alert_summaries(db, user_id)
+        except Exception as e:
+            logging.error(f"Failed to recompute alert summary for {user_id}: {str(e)}")
 
 # Routes
 @api_router.post("/auth/register", response_model=TokenResponse)
-async def register(user_data: UserRegister):
+async def register(user_data: UserRegister, db=AuthDB):
     # Check if user exists
     existing_user = await db.users.find_one({"email": user_data.email}, {"_id": 0})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email já cadastrado")
     
-    # Create user
-    hashed_pw = hash_password(user_data.password)
+    # Create user (bcrypt runs off the event loop so it cannot stall SOS requests)
+    hashed_pw = await run_in_threadpool(hash_password, user_data.password)
     user = User(
         email=user_data.email,
         name=user_data.name,
@@ -200,14 +770,14 @@ async def register(user_data: UserRegister):
     )
 
 @api_router.post("/auth/login", response_model=TokenResponse)
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, db=AuthDB):
     # Find user
     user_doc = await db.users.find_one({"email": credentials.email}, {"_id": 0})
     if not user_doc:
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
     # Verify password
-    if not verify_password(credentials.password, user_doc['password']):
+    if not await run_in_threadpool(verify_password, credentials.password, user_doc['password']):
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
     # Convert datetime
@@ -226,13 +796,13 @@ async def login(credentials: UserLogin):
     )
 
 @api_router.get("/auth/me", response_model=User)
-async def get_me(user_id: str = Depends(get_current_user)):
+async def get_me(user_id: str = Depends(get_current_user), db=ReadDB):
     # Try to find in users first
-    user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    user_doc = await db.users.find_one({"id": user_id}, USER_PROJECTION)
     
     # If not found, try trusted_contacts
     if not user_doc:
-        user_doc = await db.trusted_contacts.find_one({"id": user_id}, {"_id": 0, "password": 0})
+        user_doc = await db.trusted_contacts.find_one({"id": user_id}, USER_PROJECTION)
     
     if not user_doc:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
@@ -243,7 +813,7 @@ async def get_me(user_id: str = Depends(get_current_user)):
     return User(**user_doc)
 
 @api_router.post("/contacts", response_model=TrustedContact)
-async def create_contact(contact: TrustedContactCreate, user_id: str = Depends(get_current_user)):
+async def create_contact(contact: TrustedContactCreate, user_id: str = Depends(get_current_user), db=AuthDB):
     # Check if contact already exists
     existing = await db.trusted_contacts.find_one({"email": contact.email, "user_id": user_id}, {"_id": 0})
     if existing:
@@ -258,30 +828,30 @@ async def create_contact(contact: TrustedContactCreate, user_id: str = Depends(g
     
     contact_dict = trusted_contact.model_dump()
     contact_dict['created_at'] = contact_dict['created_at'].isoformat()
-    contact_dict['password'] = hash_password(contact.password)
+    contact_dict['password'] = await run_in_threadpool(hash_password, contact.password)
     
     await db.trusted_contacts.insert_one(contact_dict)
     return trusted_contact
 
 @api_router.get("/contacts", response_model=List[TrustedContact])
-async def get_contacts(user_id: str = Depends(get_current_user)):
-    contacts = await db.trusted_contacts.find({"user_id": user_id}, {"_id": 0}).to_list(100)
-    
-    for contact in contacts:
-        if isinstance(contact['created_at'], str):
-            contact['created_at'] = datetime.fromisoformat(contact['created_at'])
-    
-    return contacts
+async def get_contacts(user_id: str = Depends(get_current_user), db=ReadDB):
+    """List the user's contacts.
+
+    The response model is documentation only: the stored documents are
+    returned raw, without validation, to keep this polled route cheap.
+    """
+    contacts = await db.trusted_contacts.find({"user_id": user_id}, CONTACT_PROJECTION).to_list(100)
+    return JSONResponse([encode_timestamp(contact, 'created_at') for contact in contacts])
 
 @api_router.delete("/contacts/{contact_id}")
-async def delete_contact(contact_id: str, user_id: str = Depends(get_current_user)):
+async def delete_contact(contact_id: str, user_id: str = Depends(get_current_user), db=AuthDB):
     result = await db.trusted_contacts.delete_one({"id": contact_id, "user_id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Contato não encontrado")
     return {"message": "Contato removido com sucesso"}
 
 @api_router.post("/alerts/send", response_model=Alert)
-async def send_alert(alert_data: AlertCreate, user_id: str = Depends(get_current_user)):
+async def send_alert(alert_data: AlertCreate, user_id: str = Depends(get_current_user), db=EmergencyDB):
     # Get user info
     user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
     if not user_doc:
@@ -293,33 +863,33 @@ async def send_alert(alert_data: AlertCreate, user_id: str = Depends(get_current
     if not contacts:
         raise HTTPException(status_code=400, detail="Nenhum contato de confiança cadastrado")
     
-    # Send emails to all contacts
-    sent_to = []
-    for contact in contacts:
-        success = send_alert_email(
-            recipient_email=contact['email'],
-            recipient_name=contact['name'],
-            user_name=user_doc['name'],
-            location=alert_data.location
-        )
-        if success:
-            sent_to.append(contact['email'])
-    
-    # Save alert
+    # Save alert first so the web panel shows it regardless of channel delivery
     alert = Alert(
         user_id=user_id,
-        location=alert_data.location,
-        sent_to=sent_to
+        location=alert_data.location
     )
     
     alert_dict = alert.model_dump()
     alert_dict['timestamp'] = alert_dict['timestamp'].isoformat()
     
     await db.alerts.insert_one(alert_dict)
+    await update_alert_summary(
+        db,
+        user_id,
+        {
+            "$inc": {"total_alerts": 1, "unacknowledged_alerts": 1, "version": 1},
+            "$max": {"last_alert_at": alert_dict['timestamp']}
+        },
+        upsert=True
+    )
+    await publish_alert_event(ALERT_CREATED, user_id, alert.id)
+    
+    # Notify all contacts on every configured channel in the background
+    start_delivery(db, alert.id, contacts, user_doc, alert_data.location)
     return alert
 
 @api_router.get("/alerts", response_model=List[Alert])
-async def get_alerts(user_id: str = Depends(get_current_user)):
+async def get_alerts(user_id: str = Depends(get_current_user), db=ReadDB):
     alerts = await db.alerts.find({"user_id": user_id}, {"_id": 0}).sort("timestamp", -1).to_list(50)
     
     for alert in alerts:
@@ -328,23 +898,74 @@ async def get_alerts(user_id: str = Depends(get_current_user)):
     
     return alerts
 
+@api_router.get("/alerts/summary", response_model=AlertSummary)
+async def get_alert_summary(user_id: str = Depends(get_current_user), db=ReadDB):
+    owner_id = await resolve_alert_owner(db, user_id)
+    summary = await db.alert_summaries.find_one({"user_id": owner_id}, {"_id": 0})
+    if not summary:
+        return AlertSummary(user_id=owner_id)
+    
+    if isinstance(summary.get('last_alert_at'), str):
+        summary['last_alert_at'] = datetime.fromisoformat(summary['last_alert_at'])
+    
+    return AlertSummary(**summary)
+
+@api_router.post("/alerts/stream-token", response_model=StreamTokenResponse)
+async def create_stream_token(user_id: str = Depends(get_current_user)):
+    token = create_access_token({"sub": user_id, "scope": STREAM_TOKEN_SCOPE}, STREAM_TOKEN_TTL)
+    return StreamTokenResponse(token=token, expires_in=int(STREAM_TOKEN_TTL.total_seconds()))
+
+@api_router.get("/alerts/stream")
+async def stream_alert_events(user_id: str = Depends(get_stream_user)):
+    """Server-sent alert events, for EventSource clients.
+
+    Authenticate with `?token=` from POST /alerts/stream-token; the token is
+    only checked when the stream opens, so it may expire while connected.
+    """
+    # Long-lived streams are not admitted under any priority; the single
+    # lookup below uses the read pool directly
+    owner_id = await resolve_alert_owner(databases[PRIORITY_READ], user_id)
+    
+    queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+    
+    async def enqueue(event: dict):
+        if event['user_id'] == owner_id and not queue.full():
+            queue.put_nowait(event)
+    
+    async def events():
+        event_bus.subscribe(enqueue)
+        try:
+            yield f"event: ready\ndata: {json.dumps({'node': NODE_ID})}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            event_bus.unsubscribe(enqueue)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @api_router.delete("/user/clear")
-async def clear_user_data(user_id: str = Depends(get_current_user)):
+async def clear_user_data(user_id: str = Depends(get_current_user), db=AuthDB):
     await db.trusted_contacts.delete_many({"user_id": user_id})
     await db.alerts.delete_many({"user_id": user_id})
+    await db.alert_summaries.delete_one({"user_id": user_id})
     await db.users.delete_one({"id": user_id})
     return {"message": "Todos os dados foram removidos com sucesso"}
 
 # Contact endpoints
 @api_router.post("/contacts/login", response_model=TokenResponse)
-async def contact_login(credentials: ContactLogin):
+async def contact_login(credentials: ContactLogin, db=AuthDB):
     # Find contact
     contact_doc = await db.trusted_contacts.find_one({"email": credentials.email}, {"_id": 0})
     if not contact_doc:
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
     # Verify password
-    if not verify_password(credentials.password, contact_doc['password']):
+    if not await run_in_threadpool(verify_password, credentials.password, contact_doc['password']):
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
     # Convert datetime
@@ -370,9 +991,14 @@ async def contact_login(credentials: ContactLogin):
     )
 
 @api_router.get("/contacts/alerts")
-async def get_contact_alerts(user_id: str = Depends(get_current_user)):
+async def get_contact_alerts(user_id: str = Depends(get_current_user), db=ReadDB):
+    """List the alerts of the user who added this contact.
+
+    There is no response model here; the stored alert documents are returned
+    raw, with the user's name and phone added, to keep this polled route cheap.
+    """
     # Find contact
-    contact = await db.trusted_contacts.find_one({"id": user_id}, {"_id": 0})
+    contact = await db.trusted_contacts.find_one({"id": user_id}, {"_id": 0, "user_id": 1})
     if not contact:
         raise HTTPException(status_code=404, detail="Contato não encontrado")
     
@@ -385,33 +1011,38 @@ async def get_contact_alerts(user_id: str = Depends(get_current_user)):
         {"_id": 0}
     ).sort("timestamp", -1).to_list(100)
     
-    # Get user info for each alert
+    # All alerts belong to the same user, so look them up once
+    user_doc = await db.users.find_one({"id": main_user_id}, {"_id": 0, "name": 1, "phone": 1}) if alerts else None
     for alert in alerts:
-        if isinstance(alert['timestamp'], str):
-            alert['timestamp'] = datetime.fromisoformat(alert['timestamp'])
-        
-        user_doc = await db.users.find_one({"id": alert['user_id']}, {"_id": 0, "password": 0})
+        encode_timestamp(alert, 'timestamp')
         if user_doc:
             alert['user_name'] = user_doc['name']
             alert['user_phone'] = user_doc.get('phone')
     
-    return alerts
+    return JSONResponse(alerts)
 
 @api_router.post("/contacts/alerts/{alert_id}/acknowledge")
-async def acknowledge_alert(alert_id: str, user_id: str = Depends(get_current_user)):
-    # Mark alert as acknowledged
-    result = await db.alerts.update_one(
-        {"id": alert_id},
-        {"$set": {"acknowledged": True, "acknowledged_at": datetime.now(timezone.utc).isoformat()}}
+async def acknowledge_alert(alert_id: str, user_id: str = Depends(get_current_user), db=EmergencyDB):
+    # Mark alert as acknowledged (only the first acknowledgement changes the summary)
+    alert = await db.alerts.find_one_and_update(
+        {"id": alert_id, "acknowledged": {"$ne": True}},
+        {"$set": {"acknowledged": True, "acknowledged_at": datetime.now(timezone.utc).isoformat()}},
+        projection={"_id": 0, "user_id": 1}
     )
     
-    if result.modified_count == 0:
+    if not alert:
+        # Acknowledging again (another contact, or a stale list) is not an error
+        if await db.alerts.find_one({"id": alert_id}, {"_id": 1}):
+            return {"message": "Alerta confirmado"}
         raise HTTPException(status_code=404, detail="Alerta não encontrado")
     
+    await update_alert_summary(db, alert['user_id'], {"$inc": {"unacknowledged_alerts": -1, "version": 1}})
+    await publish_alert_event(ALERT_ACKNOWLEDGED, alert['user_id'], alert_id)
+    
     return {"message": "Alerta confirmado"}
 
 @api_router.delete("/contacts/clear")
-async def clear_contact_data(user_id: str = Depends(get_current_user)):
+async def clear_contact_data(user_id: str = Depends(get_current_user), db=AuthDB):
     # Only clear the contact's own data
     await db.trusted_contacts.delete_one({"id": user_id})
     return {"message": "Dados removidos com sucesso"}
@@ -432,6 +1063,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_event_bus():
+    await event_bus.start()
+
+@app.on_event("startup")
+async def create_indexes():
+    # Existing alerts get summaries from migrate_alert_summaries.py, run once
+    await databases[PRIORITY_READ].alert_summaries.create_index("user_id", unique=True)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if delivery_tasks:
+        await asyncio.wait(delivery_tasks, timeout=5)
+    await event_bus.stop()
+    for priority_client in clients.values():
+        priority_client.close()
+    for notifier in notifiers:
+        await notifier.aclose()
@@ -1,7 +1,14 @@
 import requests
 import sys
 import json
-from datetime import datetime
+import os
+import time
+import threading
+import asyncio
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 class SafeHavenAPITester:
     def __init__(self, base_url="https://safehaven-sos.preview.emergentagent.com/api"):
@@ -134,7 +141,8 @@ class SafeHavenAPITester:
         contact_data = {
             "name": "Ana Trusted",
             "email": "ana.trusted@example.com",
-            "phone": "(11) 88888-8888"
+            "phone": "(11) 88888-8888",
+            "password": "TrustedPassword123!"
         }
         
         success, response = self.run_test(
@@ -193,6 +201,35 @@ class SafeHavenAPITester:
             return True, len(response)
         return False, 0
 
+    def test_get_alert_summary(self, expected_total, expected_unacknowledged):
+        """Test the precomputed alert summary"""
+        success, response = self.run_test(
+            "Get Alert Summary",
+            "GET",
+            "alerts/summary",
+            200
+        )
+        
+        counts = (response.get('total_alerts'), response.get('unacknowledged_alerts'))
+        if success and counts == (expected_total, expected_unacknowledged):
+            return True, response.get('version')
+        if success:
+            self.log_test("Alert Summary Counts", False, f"total/unacknowledged={counts} (expected {(expected_total, expected_unacknowledged)})")
+        return False, None
+
+    def test_acknowledge_alert_twice(self, alert_id, alert_count):
+        """Test that a repeated acknowledgement succeeds but only counts once"""
+        _, version_before = self.test_get_alert_summary(alert_count, alert_count)
+        
+        first, _ = self.run_test("Acknowledge Alert", "POST", f"contacts/alerts/{alert_id}/acknowledge", 200)
+        second, _ = self.run_test("Acknowledge Alert Again", "POST", f"contacts/alerts/{alert_id}/acknowledge", 200)
+        missing, _ = self.run_test("Acknowledge Missing Alert (Should Fail)", "POST", "contacts/alerts/missing-alert/acknowledge", 404)
+        
+        counted, version_after = self.test_get_alert_summary(alert_count, alert_count - 1)
+        version_bumped = version_before is not None and version_after == version_before + 1
+        self.log_test("Alert Summary Version Bumped Once", version_bumped, f"version {version_before} -> {version_after}")
+        return first and second and missing and counted and version_bumped
+
     def test_delete_contact(self, contact_id):
         """Test deleting trusted contact"""
         success, response = self.run_test(
@@ -246,6 +283,57 @@ class SafeHavenAPITester:
         self.token = original_token
         return success
 
+    def measure_sos_latencies(self, samples):
+        """Send SOS alerts sequentially and return latencies in milliseconds"""
+        headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'}
+        latencies = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            response = requests.post(f"{self.base_url}/alerts/send", json={"location": "Benchmark"}, headers=headers, timeout=30)
+            if response.status_code == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    def benchmark_sos_under_read_load(self, samples=50, pollers=64):
+        """Compare SOS p99 latency idle vs. with read polling saturating the worker"""
+        def p99(values):
+            ordered = sorted(values)
+            return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] if ordered else float('nan')
+
+        idle = self.measure_sos_latencies(samples)
+
+        stop = threading.Event()
+        polled = [0]
+        shed = [0]
+        headers = {'Authorization': f'Bearer {self.token}'}
+
+        def poll():
+            session = requests.Session()
+            while not stop.is_set():
+                try:
+                    response = session.get(f"{self.base_url}/alerts", headers=headers, timeout=30)
+                    polled[0] += 1
+                    if response.status_code == 503:
+                        shed[0] += 1
+                except Exception:
+                    pass
+
+        threads = [threading.Thread(target=poll, daemon=True) for _ in range(pollers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(2)
+        loaded = self.measure_sos_latencies(samples)
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=30)
+
+        idle_p99, loaded_p99 = p99(idle), p99(loaded)
+        details = (f"SOS p99 idle: {idle_p99:.1f}ms, under load: {loaded_p99:.1f}ms "
+                   f"({polled[0]} reads, {shed[0]} shed with 503)")
+        # Allow some jitter, but SOS latency should not grow with the read backlog
+        self.log_test("SOS p99 Under Read Saturation", len(loaded) == samples and loaded_p99 <= max(idle_p99 * 2, idle_p99 + 100), details)
+        return idle_p99, loaded_p99
+
     def run_all_tests(self):
         """Run complete test suite"""
         print("🚀 Starting SafeHaven API Tests...")
@@ -274,7 +362,8 @@ class SafeHavenAPITester:
             # Test emergency alert (requires contacts)
             alert_success, alert_id = self.test_send_emergency_alert()
             if alert_success:
-                self.test_get_alerts_history()
+                _, alert_count = self.test_get_alerts_history()
+                self.test_acknowledge_alert_twice(alert_id, alert_count)
             
             # Test contact deletion
             self.test_delete_contact(contact_id)
@@ -297,7 +386,308 @@ class SafeHavenAPITester:
             print(f"⚠️  {self.tests_run - self.tests_passed} tests failed")
             return False
 
+def start_server_nodes(nodes, base_port, env=None):
+    """Start several local server workers that share the configured event bus"""
+    backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+    processes, urls = [], []
+    try:
+        for i in range(nodes):
+            port = base_port + i
+            node_env = dict(os.environ, **(env or {}), NODE_ID=f"node-{i}")
+            # stderr is inherited so startup errors stay visible
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port)],
+                cwd=backend_dir, env=node_env, stdout=subprocess.DEVNULL
+            ))
+            urls.append(f"http://127.0.0.1:{port}/api")
+        
+        deadline = time.time() + 30
+        for process, url in zip(processes, urls):
+            while True:
+                try:
+                    requests.get(f"{url}/alerts/summary", timeout=1)
+                    break
+                except requests.exceptions.ConnectionError:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"Server at {url} exited with code {process.returncode}")
+                    if time.time() > deadline:
+                        raise RuntimeError(f"Server at {url} did not start")
+                    time.sleep(0.2)
+    except BaseException:
+        stop_server_nodes(processes)
+        raise
+    return processes, urls
+
+def stop_server_nodes(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait(timeout=10)
+
+def follow_stream(url, token, ready, received):
+    """Read server-sent events from one node, recording the arrival time of each"""
+    # Streams authenticate like EventSource clients: a stream token in the query string
+    stream_token = requests.post(f"{url}/alerts/stream-token", headers={'Authorization': f'Bearer {token}'}, timeout=10).json()['token']
+    with requests.get(f"{url}/alerts/stream", params={'token': stream_token}, stream=True, timeout=60) as response:
+        event_type = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event_type = line[len("event: "):]
+            elif line.startswith("data: "):
+                if event_type == "ready":
+                    ready.set()
+                else:
+                    received.append((json.loads(line[len("data: "):]), datetime.now(timezone.utc)))
+
+def run_event_bus_test(nodes=3, base_port=8101):
+    """Check that alert events published on one node reach subscribers on every other node"""
+    backend = os.environ.get('EVENT_BUS', '')
+    if backend not in ("redis", "mongo"):
+        print("❌ --event-bus needs a shared event bus: run with EVENT_BUS=redis or EVENT_BUS=mongo")
+        print("   (with the in-memory bus each node only sees its own events)")
+        return False
+    print(f"🚀 Starting {nodes} server nodes (EVENT_BUS={backend})...")
+    processes, urls = start_server_nodes(nodes, base_port, env={"EVENT_BUS": backend})
+    tester = SafeHavenAPITester(base_url=urls[0])
+    try:
+        reg_success, _ = tester.test_user_registration()
+        contact_email = f"bus_contact_{datetime.now().strftime('%H%M%S%f')}@example.com"
+        success, contact = tester.run_test("Add Bus Contact", "POST", "contacts", 200, data={
+            "name": "Bus Contact", "email": contact_email, "password": "TrustedPassword123!"
+        })
+        if not (reg_success and success):
+            return False
+        _, login = tester.run_test("Bus Contact Login", "POST", "contacts/login", 200, data={
+            "email": contact_email, "password": "TrustedPassword123!"
+        })
+        contact_token = login.get('access_token')
+        
+        streams = []
+        for url in urls[1:]:
+            ready, received = threading.Event(), []
+            threading.Thread(target=follow_stream, args=(url, contact_token, ready, received), daemon=True).start()
+            streams.append((url, ready, received))
+        for url, ready, _ in streams:
+            tester.log_test(f"Stream Ready on {url}", ready.wait(10))
+        
+        alert_success, alert_id = tester.test_send_emergency_alert()
+        if not alert_success:
+            return False
+        user_token, tester.token = tester.token, contact_token
+        tester.base_url = urls[1]
+        tester.run_test("Acknowledge Alert on Another Node", "POST", f"contacts/alerts/{alert_id}/acknowledge", 200)
+        tester.base_url, tester.token = urls[0], user_token
+        
+        for event_type in ("alert.created", "alert.acknowledged"):
+            for url, _, received in streams:
+                deadline = time.time() + 10
+                match = None
+                while match is None and time.time() < deadline:
+                    match = next((r for r in received if r[0]['type'] == event_type and r[0]['alert_id'] == alert_id), None)
+                    time.sleep(0.01)
+                if match is None:
+                    tester.log_test(f"{event_type} on {url}", False, "event not received within 10s")
+                    continue
+                event, arrived = match
+                latency = (arrived - datetime.fromisoformat(event['published_at'])).total_seconds() * 1000
+                tester.log_test(f"{event_type} on {url}", True, f"from {event['node']}, end-to-end latency {latency:.1f}ms")
+        
+        tester.test_clear_user_data()
+        return tester.tests_passed == tester.tests_run
+    finally:
+        stop_server_nodes(processes)
+
+async def profile_hot_paths(requests_per_endpoint=200, alerts=50):
+    """Measure per-request peak allocations and CPU of the hot read paths in-process"""
+    import httpx
+    # Disable every notifier and the shared event bus so the setup alerts stay local.
+    # Empty values (rather than unset ones) are not overridden by backend/.env.
+    for key in ("SENDGRID_API_KEY", "SMS_GATEWAY_URL", "PUSH_GATEWAY_URL", "ALERT_WEBHOOK_URL"):
+        os.environ[key] = ""
+    os.environ["EVENT_BUS"] = "memory"
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    import server
+    
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://profile/api") as client:
+        stamp = datetime.now().strftime('%H%M%S%f')
+        response = await client.post("/auth/register", json={
+            "email": f"profile_{stamp}@example.com", "password": "TestPassword123!", "name": "Profile User", "phone": "(11) 99999-9999"
+        })
+        user_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        for i in range(3):
+            await client.post("/contacts", headers=user_headers, json={
+                "name": f"Contact {i}", "email": f"profile_{stamp}_{i}@example.com", "password": "TrustedPassword123!"
+            })
+        for _ in range(alerts):
+            await client.post("/alerts/send", headers=user_headers, json={"location": "Profile"})
+        response = await client.post("/contacts/login", json={"email": f"profile_{stamp}_0@example.com", "password": "TrustedPassword123!"})
+        contact_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        
+        results = {}
+        for endpoint, headers in (("/contacts/alerts", contact_headers), ("/contacts", user_headers), ("/auth/me", user_headers)):
+            for _ in range(10):
+                await client.get(endpoint, headers=headers)
+            tracemalloc.start()
+            peak_total, cpu_total = 0, 0.0
+            for _ in range(requests_per_endpoint):
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                cpu_start = time.process_time()
+                await client.get(endpoint, headers=headers)
+                cpu_total += time.process_time() - cpu_start
+                peak_total += tracemalloc.get_traced_memory()[1] - baseline
+            tracemalloc.stop()
+            results[endpoint] = {
+                "peak_kib_per_request": round(peak_total / requests_per_endpoint / 1024, 1),
+                "cpu_ms_per_request": round(cpu_total / requests_per_endpoint * 1000, 3),
+            }
+            print(f"{endpoint}: {results[endpoint]['peak_kib_per_request']} KiB peak, {results[endpoint]['cpu_ms_per_request']} ms CPU per request")
+        
+        await client.delete("/user/clear", headers=user_headers)
+    return results
+
+def start_stub_server(status=200, delay=0):
+    """Start a local HTTP stub that records POST bodies and answers with a fixed status"""
+    received = []
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            received.append({"path": self.path, "body": json.loads(self.rfile.read(length) or b"{}")})
+            time.sleep(delay)
+            try:
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received, f"http://127.0.0.1:{server.server_port}"
+
+def run_notifier_test(port=8201):
+    """Send an alert through every notification channel against local stub servers"""
+    email, email_received, email_url = start_stub_server(status=202)
+    sms, sms_received, sms_url = start_stub_server(status=500)
+    push, push_received, push_url = start_stub_server(delay=3)
+    webhook, webhook_received, webhook_url = start_stub_server()
+    stubs = [email, sms, push, webhook]
+    
+    print("🚀 Starting server with notification channels pointed at local stubs...")
+    processes, urls = start_server_nodes(1, port, env={
+        "SENDGRID_API_KEY": "stub-key",
+        "SENDGRID_API_URL": email_url,
+        "SMS_GATEWAY_URL": sms_url,
+        "PUSH_GATEWAY_URL": push_url,
+        "PUSH_TIMEOUT": "1",
+        "ALERT_WEBHOOK_URL": webhook_url,
+    })
+    tester = SafeHavenAPITester(base_url=urls[0])
+    try:
+        reg_success, _ = tester.test_user_registration()
+        if not reg_success:
+            return False
+        stamp = datetime.now().strftime('%H%M%S%f')
+        contact_ids = []
+        for i, phone in enumerate(["(11) 88888-8888", None]):
+            success, contact = tester.run_test(f"Add Stub Contact {i}", "POST", "contacts", 200, data={
+                "name": f"Stub Contact {i}", "email": f"stub_{stamp}_{i}@example.com",
+                "phone": phone, "password": "TrustedPassword123!"
+            })
+            if not success:
+                return False
+            contact_ids.append(contact['id'])
+        
+        sent_at = time.perf_counter()
+        success, _ = tester.run_test("Send Alert Through Stubs", "POST", "alerts/send", 200, data={"location": "Stub"})
+        if not success:
+            return False
+        elapsed = time.perf_counter() - sent_at
+        tester.log_test("SOS Does Not Wait For Slow Channel", elapsed < 1, f"{elapsed * 1000:.0f}ms (push stub takes 3s)")
+        
+        # Deliveries are recorded in the background; wait past the 1s push timeout
+        deadline = time.time() + 10
+        while True:
+            _, alerts = tester.run_test("Get Stored Alert", "GET", "alerts", 200)
+            alert = alerts[0] if alerts else {}
+            deliveries = alert.get('deliveries', {})
+            recorded = all('email' in deliveries.get(contact_id, {}) for contact_id in contact_ids) and 'webhook' in alert.get('broadcasts', {})
+            if (recorded and time.perf_counter() - sent_at > 2) or time.time() > deadline:
+                break
+            time.sleep(0.5)
+        
+        tester.log_test("Alert Sent To Both Contacts", len(alert.get('sent_to', [])) == 2, f"sent_to={alert.get('sent_to')}")
+        tester.log_test(
+            "Email Delivery Recorded Per Contact",
+            all('email' in deliveries.get(contact_id, {}) for contact_id in contact_ids) and len(email_received) == 2,
+            f"deliveries={deliveries}"
+        )
+        tester.log_test(
+            "Failed SMS Not Recorded",
+            len(sms_received) == 1 and not any('sms' in channels for channels in deliveries.values()),
+            f"{len(sms_received)} SMS request(s)"
+        )
+        tester.log_test(
+            "Timed Out Push Not Recorded",
+            len(push_received) == 2 and not any('push' in channels for channels in deliveries.values()),
+            f"{len(push_received)} push request(s)"
+        )
+        tester.log_test(
+            "Webhook Sent Once Per Alert",
+            len(webhook_received) == 1 and len(webhook_received[0]['body'].get('contacts', [])) == 2
+            and 'webhook' in alert.get('broadcasts', {}),
+            f"{len(webhook_received)} webhook request(s), broadcasts={alert.get('broadcasts')}"
+        )
+        
+        tester.test_clear_user_data()
+        return tester.tests_passed == tester.tests_run
+    finally:
+        stop_server_nodes(processes)
+        for stub in stubs:
+            stub.shutdown()
+
+def run_sos_benchmark(port=8401):
+    """Measure SOS p99 on a local worker, idle and with read polling saturating it"""
+    print("🚀 Starting local server for the SOS scheduling benchmark...")
+    # Notifiers are disabled so the measurement covers scheduling, not fan-out
+    processes, urls = start_server_nodes(1, port, env={
+        "SENDGRID_API_KEY": "",
+        "SMS_GATEWAY_URL": "",
+        "PUSH_GATEWAY_URL": "",
+        "ALERT_WEBHOOK_URL": "",
+        "EVENT_BUS": "memory",
+    })
+    tester = SafeHavenAPITester(base_url=urls[0])
+    try:
+        reg_success, _ = tester.test_user_registration()
+        contact_success, _ = tester.test_add_trusted_contact()
+        if not (reg_success and contact_success):
+            return False
+        tester.benchmark_sos_under_read_load()
+        tester.test_clear_user_data()
+        return tester.tests_passed == tester.tests_run
+    finally:
+        stop_server_nodes(processes)
+
 def main():
+    if "--bench" in sys.argv:
+        return 0 if run_sos_benchmark() else 1
+    
+    if "--notifiers" in sys.argv:
+        return 0 if run_notifier_test() else 1
+    
+    if "--event-bus" in sys.argv:
+        return 0 if run_event_bus_test() else 1
+    
+    if "--profile" in sys.argv:
+        asyncio.run(profile_hot_paths())
+        return 0
+    
     tester = SafeHavenAPITester()
     success = tester.run_all_tests()
     
@@ -0,0 +1,36 @@
+import { useCallback, useEffect, useRef } from "react";
+import { axiosInstance } from "../App";
+
+// Polls /alerts/summary and calls `loadList(force)` only when the summary
+// version changed since the last successful load (or when forced). The summary
+// is read before the list, so an alert created in between leaves the stored
+// version behind and is picked up by the next poll. `loadList` resolves to true
+// once the list was loaded; only then is the version stored.
+function useAlertSummaryPolling(loadList, intervalMs) {
+  const version = useRef(null);
+  const loadListRef = useRef(loadList);
+  loadListRef.current = loadList;
+
+  const refresh = useCallback(async (force = false) => {
+    try {
+      const { data: summary } = await axiosInstance.get("/alerts/summary");
+      if (force || summary.version !== version.current) {
+        if (await loadListRef.current(force)) {
+          version.current = summary.version;
+        }
+      }
+    } catch (error) {
+      console.error("Erro ao verificar alertas", error);
+    }
+  }, []);
+
+  useEffect(() => {
+    refresh();
+    const interval = setInterval(() => refresh(), intervalMs);
+    return () => clearInterval(interval);
+  }, [refresh, intervalMs]);
+
+  return refresh;
+}
+
+export { useAlertSummaryPolling };
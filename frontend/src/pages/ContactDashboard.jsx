@@ -16,6 +16,7 @@ import {
   AlertDialogTrigger,
 } from "@/components/ui/alert-dialog";
 import { SafeHavenLogoCompact } from "@/components/SafeHavenLogo";
+import { useAlertSummaryPolling } from "@/hooks/use-alert-summary";
 
 export default function ContactDashboard({ onLogout }) {
   const [user, setUser] = useState(null);
@@ -27,14 +28,6 @@ export default function ContactDashboard({ onLogout }) {
 
   useEffect(() => {
     loadUser();
-    loadAlerts();
-    
-    // Poll for new alerts every 10 seconds
-    const interval = setInterval(() => {
-      loadAlerts(true);
-    }, 10000);
-    
-    return () => clearInterval(interval);
   }, []);
 
   const loadUser = async () => {
@@ -66,12 +59,17 @@ export default function ContactDashboard({ onLogout }) {
       previousAlertCount.current = newAlerts.length;
       setAlerts(newAlerts);
       setLoading(false);
+      return true;
     } catch (error) {
       console.error("Erro ao carregar alertas", error);
       setLoading(false);
+      return false;
     }
   };
 
+  // Poll every 10 seconds; polls are silent, forced reloads show toasts
+  const refreshAlerts = useAlertSummaryPolling((force) => loadAlerts(!force), 10000);
+
   const playAlertSound = () => {
     if (audioRef.current) {
       audioRef.current.play().catch(err => console.log("Audio play failed:", err));
@@ -82,7 +80,7 @@ export default function ContactDashboard({ onLogout }) {
     try {
       await axiosInstance.post(`/contacts/alerts/${alertId}/acknowledge`);
       toast.success("Alerta confirmado");
-      loadAlerts();
+      refreshAlerts(true);
     } catch (error) {
       toast.error("Erro ao confirmar alerta");
     }
@@ -90,7 +88,7 @@ export default function ContactDashboard({ onLogout }) {
 
   const handleRefresh = () => {
     setLoading(true);
-    loadAlerts();
+    refreshAlerts(true);
     toast.info("Atualizando alertas...");
   };
 
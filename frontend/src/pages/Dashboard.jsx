@@ -5,6 +5,7 @@ import { axiosInstance } from "../App";
 import { toast } from "sonner";
 import { AlertCircle, Users, Settings, LogOut, UserPlus, Trash2, Mail, Phone, AlertTriangle } from "lucide-react";
 import { SafeHavenLogoCompact } from "@/components/SafeHavenLogo";
+import { useAlertSummaryPolling } from "@/hooks/use-alert-summary";
 import {
   Dialog,
   DialogContent,
@@ -40,7 +41,6 @@ export default function Dashboard({ onLogout }) {
   useEffect(() => {
     loadUser();
     loadContacts();
-    loadAlerts();
   }, []);
 
   const loadUser = async () => {
@@ -65,11 +65,16 @@ export default function Dashboard({ onLogout }) {
     try {
       const response = await axiosInstance.get("/alerts");
       setAlerts(response.data);
+      return true;
     } catch (error) {
       console.error("Erro ao carregar alertas");
+      return false;
     }
   };
 
+  // Refresh alert history (e.g. acknowledgements) every 15 seconds
+  const refreshAlerts = useAlertSummaryPolling(loadAlerts, 15000);
+
   const handleAddContact = async (e) => {
     e.preventDefault();
     try {
@@ -119,7 +124,7 @@ export default function Dashboard({ onLogout }) {
         description: "Eles receberão um email de emergência.",
         duration: 5000,
       });
-      loadAlerts();
+      refreshAlerts();
     } catch (error) {
       toast.error(error.response?.data?.detail || "Erro ao enviar alerta");
     } finally {